@@ -1,28 +1,82 @@
 #!/usr/bin/env python3
+import hashlib
 import json
 import mimetypes
 import os
+import queue
 import re
 import sqlite3
 import ssl
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from email import message_from_bytes
+from email import message_from_bytes, policy
 from email.message import EmailMessage
-from email.utils import getaddresses, parsedate_to_datetime
+from email.parser import BytesParser
+from email.utils import formatdate, getaddresses, parsedate_to_datetime
 import imaplib
 import smtplib
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from urllib.parse import parse_qs, urlparse
+from urllib.parse import unquote_plus
+
+try:
+    import orjson
+except ImportError:  # optional; stdlib json is used otherwise
+    orjson = None
 
 ROOT = Path(__file__).parent
 DB_PATH = ROOT / "mailchat.db"
 STATIC_DIR = ROOT / "static"
 DB_LOCK = threading.Lock()
-
-NOREPLY_RE = re.compile(r"(?i)(^|[._-])(no[._-]?reply|noreply|do[._-]?not[._-]?reply|mailer-daemon|newsletter|marketing)([._-]|$)")
-PROMO_SUBJECT_RE = re.compile(r"(?i)(newsletter|angebot|sale|rabatt|unsubscribe|werbung|promo)")
+DB_LOCAL = threading.local()
+IMAP_POOL: dict[int, imaplib.IMAP4] = {}
+IMAP_LOCKS: dict[int, threading.Lock] = {}
+IMAP_POOL_LOCK = threading.Lock()
+SMTP_POOL: dict[int, tuple[smtplib.SMTP, float, int]] = {}
+SMTP_LOCKS: dict[int, threading.Lock] = {}
+SMTP_POOL_LOCK = threading.Lock()
+SETTINGS_CACHE: dict | None = None
+SETTINGS_LOCK = threading.Lock()
+ACCOUNT_CACHE: dict[int, dict] = {}
+STATIC_ASSETS: dict[Path, tuple[int, bytes, str, str]] = {}
+STATIC_LOCK = threading.Lock()
+STATIC_CACHE_MAX_BYTES = 1024 * 1024
+
+# Matched against lowercased input.
+NOREPLY_RE = re.compile(r"(?:^|[._-])(?:no[._-]?reply|noreply|do[._-]?not[._-]?reply|mailer-daemon|newsletter|marketing)(?:[._-]|$)")
+PROMO_SUBJECT_KEYWORDS = ("newsletter", "angebot", "sale", "rabatt", "unsubscribe", "werbung", "promo")
+PROMO_SUBJECT_RE = re.compile("|".join(PROMO_SUBJECT_KEYWORDS))
+BULK_PRECEDENCE = ("bulk", "list", "junk")
+FETCH_UID_RE = re.compile(rb"\bUID (\d+)")
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+WHITESPACE_RE = re.compile(r"\s+")
+QUOTE_CUT_RE = re.compile(
+    r"(?i)^(?:On .+wrote:$|Am .+schrieb.+:$|From:\s|Von:\s|>+|-{2,}\s*Original Message\s*-{2,})"
+)
+QUOTE_CUT_FIRST_CHARS = frozenset("OoAaFfVv>-")
+HTML_CONTENT_TYPES = frozenset({"text/html", "application/xhtml+xml"})
+BYTE_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+HEADER_PARSER = BytesParser(policy=policy.default)
+
+SYNC_MAX_MESSAGES = 200
+IMAP_FETCH_BATCH = 50
+IMAP_HEADER_ITEMS = "(UID BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE MESSAGE-ID LIST-ID PRECEDENCE AUTO-SUBMITTED)])"
+IMAP_MESSAGE_ITEMS = "(UID BODY.PEEK[])"
+
+SERVICE_UNAVAILABLE_RESPONSE = b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nRetry-After: 1\r\nConnection: close\r\n\r\n"
+
+SMTP_IDLE_SECONDS = 60
+SMTP_MAX_SENDS = 100
+
+UPSERT_CONTACT_SQL = "INSERT INTO contacts(account_id, email, display_name) VALUES(?,?,?) ON CONFLICT(account_id, email) DO UPDATE SET display_name=COALESCE(NULLIF(excluded.display_name, ''), contacts.display_name)"
+INSERT_INBOUND_SQL = """
+    INSERT OR IGNORE INTO messages(account_id, contact_email, direction, subject, body, body_html, sent_at, external_message_id, created_at)
+    VALUES (?, ?, 'inbound', ?, ?, ?, ?, ?, ?)
+"""
 
 DEFAULT_SETTINGS = {
     "poll_interval_ms": "1000",
@@ -38,8 +92,23 @@ def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def db_connect() -> sqlite3.Connection:
+    conn = getattr(DB_LOCAL, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+        DB_LOCAL.conn = conn
+    return conn
+
+
 def init_db() -> None:
-    with DB_LOCK, sqlite3.connect(DB_PATH) as conn:
+    conn = db_connect()
+    conn.execute("PRAGMA journal_mode=WAL")
+    with DB_LOCK, conn:
         conn.execute("""
             CREATE TABLE IF NOT EXISTS accounts (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -127,14 +196,17 @@ def init_db() -> None:
         ac_cols = {row[1] for row in conn.execute("PRAGMA table_info(accounts)").fetchall()}
         if "smtp_security" not in ac_cols:
             conn.execute("ALTER TABLE accounts ADD COLUMN smtp_security TEXT NOT NULL DEFAULT 'auto'")
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'").fetchall()}
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_account_contact_sent ON messages(account_id, contact_email, sent_at DESC, id DESC)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_group_messages_account_group_id ON group_messages(account_id, group_id, id)")
+        if not {"idx_messages_account_contact_sent", "idx_group_messages_account_group_id"} <= indexes:
+            conn.execute("ANALYZE")
         for k, v in DEFAULT_SETTINGS.items():
             conn.execute("INSERT OR IGNORE INTO settings(key, value) VALUES(?,?)", (k, v))
 
 
 def db_fetch_all(query: str, params=()):
-    with DB_LOCK, sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        return [dict(r) for r in conn.execute(query, params).fetchall()]
+    return [dict(r) for r in db_connect().execute(query, params).fetchall()]
 
 
 def db_fetch_one(query: str, params=()):
@@ -142,26 +214,61 @@ def db_fetch_one(query: str, params=()):
     return rows[0] if rows else None
 
 
+@contextmanager
+def db_transaction():
+    conn = db_connect()
+    with DB_LOCK, conn:
+        yield conn
+
+
 def db_execute(query: str, params=()):
-    with DB_LOCK, sqlite3.connect(DB_PATH) as conn:
+    with db_transaction() as conn:
         cur = conn.execute(query, params)
-        conn.commit()
-        return cur.lastrowid
+    return cur.lastrowid
 
 
 def get_settings() -> dict:
-    settings = {r["key"]: r["value"] for r in db_fetch_all("SELECT key, value FROM settings")}
-    merged = dict(DEFAULT_SETTINGS)
-    merged.update(settings)
-    return merged
+    global SETTINGS_CACHE
+    # Load under the lock so a concurrent invalidate_settings() is not overwritten.
+    with SETTINGS_LOCK:
+        if SETTINGS_CACHE is None:
+            settings = {r["key"]: r["value"] for r in db_fetch_all("SELECT key, value FROM settings")}
+            SETTINGS_CACHE = dict(DEFAULT_SETTINGS)
+            SETTINGS_CACHE.update(settings)
+        return dict(SETTINGS_CACHE)
+
+
+def invalidate_settings() -> None:
+    global SETTINGS_CACHE
+    with SETTINGS_LOCK:
+        SETTINGS_CACHE = None
+
+
+def get_account(account_id: int) -> dict | None:
+    # Misses are not cached; the account may be created later.
+    account = ACCOUNT_CACHE.get(account_id)
+    if account is None:
+        account = db_fetch_one(
+            "SELECT id, email, imap_host, imap_port, smtp_host, smtp_port, password, use_ssl, smtp_security FROM accounts WHERE id=?",
+            (account_id,),
+        )
+        if account is not None:
+            ACCOUNT_CACHE[account_id] = account
+    return account
 
 
 def setting_bool(settings: dict, key: str) -> bool:
     return str(settings.get(key, "0")).strip().lower() in {"1", "true", "yes", "on"}
 
 
+def json_dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, separators=(",", ":"), default=str).encode("utf-8")
+
+
 def json_response(handler: BaseHTTPRequestHandler, data, status=200):
-    body = json.dumps(data).encode("utf-8")
+    body = json_dumps(data)
     try:
         handler.send_response(status)
         handler.send_header("Content-Type", "application/json; charset=utf-8")
@@ -174,6 +281,70 @@ def json_response(handler: BaseHTTPRequestHandler, data, status=200):
     return True
 
 
+def load_static_asset(file_path: Path) -> tuple[int, bytes, str, str]:
+    with open(file_path, "rb") as f:
+        mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+        raw = f.read()
+    content_type = mimetypes.guess_type(str(file_path))[0] or "application/octet-stream"
+    etag = f'"{hashlib.blake2b(raw, digest_size=16).hexdigest()}"'
+    return mtime_ns, raw, content_type, etag
+
+
+def preload_static_assets() -> None:
+    for file_path in STATIC_DIR.rglob("*"):
+        if file_path.is_file() and file_path.stat().st_size <= STATIC_CACHE_MAX_BYTES:
+            STATIC_ASSETS[file_path] = load_static_asset(file_path)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def modified_since(if_modified_since: str | None, mtime: int) -> bool:
+    if not if_modified_since:
+        return True
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return True
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return mtime > since.timestamp()
+
+
+def parse_byte_range(header: str | None, size: int) -> tuple[int, int] | None:
+    # Half-open (start, stop); None serves the whole file, ValueError means 416.
+    match = BYTE_RANGE_RE.fullmatch(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(size - length, 0), size
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("unsatisfiable range")
+    return start, min(int(last) + 1, size) if last else size
+
+
+def query_param(query: str, key: str, default: str = "") -> str:
+    for pair in query.split("&"):
+        name, _, value = pair.partition("=")
+        if name == key and value:
+            return unquote_plus(value)
+    return default
+
+
 def parse_json_body(handler: BaseHTTPRequestHandler):
     length = int(handler.headers.get("Content-Length", "0"))
     raw = handler.rfile.read(length)
@@ -186,47 +357,53 @@ def decode_payload(part) -> str:
     return payload.decode(charset, errors="replace").strip()
 
 
+def html_to_text(html: str) -> str:
+    return WHITESPACE_RE.sub(" ", HTML_TAG_RE.sub(" ", html)).strip()
+
+
 def strip_quoted_text(text: str) -> str:
     lines = text.splitlines()
-    cut_tokens = [
-        r"^On .+wrote:$",
-        r"^Am .+schrieb.+:$",
-        r"^From:\s",
-        r"^Von:\s",
-        r"^>+",
-        r"^-{2,}\s*Original Message\s*-{2,}",
-    ]
     for i, line in enumerate(lines):
-        if any(re.search(pat, line.strip(), re.IGNORECASE) for pat in cut_tokens):
+        line = line.strip()
+        if line[:1] not in QUOTE_CUT_FIRST_CHARS:
+            continue
+        if QUOTE_CUT_RE.match(line):
             lines = lines[:i]
             break
     cleaned = "\n".join(lines).strip()
     return cleaned
 
 
+def iter_body_parts(part):
+    # Inline leaf parts, including forwarded message/rfc822; attachments are skipped.
+    if part.get_content_disposition() == "attachment":
+        return
+    if part.is_multipart():
+        for subpart in part.get_payload():
+            yield from iter_body_parts(subpart)
+    else:
+        yield part
+
+
 def extract_bodies(msg, strip_replies=True) -> tuple[str, str | None]:
     text = ""
     html = None
     if msg.is_multipart():
-        for part in msg.walk():
+        for part in iter_body_parts(msg):
             ctype = part.get_content_type()
-            dispo = (part.get("Content-Disposition") or "").lower()
-            if "attachment" in dispo:
-                continue
             if ctype == "text/plain" and not text:
                 text = decode_payload(part)
-            elif ctype in {"text/html", "application/xhtml+xml"} and not html:
+            elif ctype in HTML_CONTENT_TYPES and not html:
                 html = decode_payload(part)
+            if text and html:
+                break
+    elif msg.get_content_type() in HTML_CONTENT_TYPES:
+        html = decode_payload(msg)
     else:
-        ctype = msg.get_content_type()
-        if ctype in {"text/html", "application/xhtml+xml"}:
-            html = decode_payload(msg)
-        else:
-            text = decode_payload(msg)
+        text = decode_payload(msg)
 
     if not text and html:
-        text = re.sub(r"<[^>]+>", " ", html)
-        text = re.sub(r"\s+", " ", text).strip()
+        text = html_to_text(html)
     if strip_replies and text:
         text = strip_quoted_text(text)
     return text, html
@@ -240,165 +417,303 @@ def parse_from_header(from_header: str) -> tuple[str, str | None]:
     return from_header.lower().strip(), None
 
 
-def should_skip_message(sender: str, subject: str, msg, settings: dict) -> bool:
+def should_skip_message(sender: str, subject: str, msg, filter_noreply: bool, filter_info: bool, filter_promo: bool) -> bool:
     sender_l = sender.lower().strip()
     subject_l = (subject or "").lower()
     list_id = (msg.get("List-ID") or "").lower()
     precedence = (msg.get("Precedence") or "").lower()
     auto_sub = (msg.get("Auto-Submitted") or "").lower()
 
-    if setting_bool(settings, "filter_noreply") and NOREPLY_RE.search(sender_l):
+    if filter_noreply and NOREPLY_RE.search(sender_l):
         return True
-    if setting_bool(settings, "filter_info_addresses") and sender_l.startswith("info@"):
+    if filter_info and sender_l.startswith("info@"):
         return True
-    if setting_bool(settings, "filter_promotions"):
+    if filter_promo:
         if PROMO_SUBJECT_RE.search(subject_l):
             return True
-        if list_id or precedence in {"bulk", "list", "junk"} or auto_sub not in {"", "no"}:
+        if list_id or precedence in BULK_PRECEDENCE or auto_sub not in {"", "no"}:
             return True
     return False
 
 
 def upsert_contact(account_id: int, email: str, display_name: str | None = None):
-    db_execute("INSERT OR IGNORE INTO contacts(account_id, email, display_name) VALUES(?,?,?)", (account_id, email, display_name))
-    if display_name:
-        db_execute("UPDATE contacts SET display_name=? WHERE account_id=? AND email=?", (display_name, account_id, email))
+    db_execute(UPSERT_CONTACT_SQL, (account_id, email, display_name))
 
 
-def smtp_send_with_security(account, msg: EmailMessage):
+def smtp_connect(account) -> smtplib.SMTP:
     security = (account.get("smtp_security") or "auto").lower()
     host = account["smtp_host"]
     port = int(account["smtp_port"])
 
-    def send_ssl():
-        with smtplib.SMTP_SSL(host, port, timeout=20) as server:
+    def login(server):
+        try:
             server.login(account["email"], account["password"])
-            server.send_message(msg)
+        except BaseException:
+            server.close()
+            raise
+        return server
+
+    def connect_ssl():
+        return login(smtplib.SMTP_SSL(host, port, timeout=20))
 
-    def send_starttls():
-        with smtplib.SMTP(host, port, timeout=20) as server:
+    def connect_starttls():
+        server = smtplib.SMTP(host, port, timeout=20)
+        try:
             server.ehlo()
             server.starttls()
             server.ehlo()
-            server.login(account["email"], account["password"])
-            server.send_message(msg)
+        except BaseException:
+            server.close()
+            raise
+        return login(server)
 
-    def send_plain():
-        with smtplib.SMTP(host, port, timeout=20) as server:
-            server.login(account["email"], account["password"])
-            server.send_message(msg)
+    def connect_plain():
+        return login(smtplib.SMTP(host, port, timeout=20))
 
     if security == "ssl":
-        return send_ssl()
+        return connect_ssl()
     if security == "starttls":
-        return send_starttls()
+        return connect_starttls()
     if security == "plain":
-        return send_plain()
+        return connect_plain()
 
-    methods = [send_ssl, send_starttls, send_plain] if port == 465 else [send_starttls, send_ssl, send_plain]
+    methods = [("ssl", connect_ssl), ("starttls", connect_starttls), ("plain", connect_plain)]
+    if port != 465:
+        methods[0], methods[1] = methods[1], methods[0]
     last_error = None
-    for method in methods:
+    for name, method in methods:
         try:
-            return method()
+            server = method()
         except (ssl.SSLError, smtplib.SMTPException, OSError) as err:
             last_error = err
+            continue
+        if name != "plain":
+            db_execute("UPDATE accounts SET smtp_security=? WHERE id=?", (name, account["id"]))
+            ACCOUNT_CACHE.pop(account["id"], None)
+        return server
     raise ValueError(f"SMTP Versand fehlgeschlagen: {last_error}")
 
 
-def sync_account(account_id: int):
-    account = db_fetch_one("SELECT * FROM accounts WHERE id=?", (account_id,))
-    if not account:
-        raise ValueError("Konto wurde nicht gefunden.")
-    settings = get_settings()
+def smtp_lock(account_id: int) -> threading.Lock:
+    with SMTP_POOL_LOCK:
+        return SMTP_LOCKS.setdefault(account_id, threading.Lock())
 
-    state = db_fetch_one("SELECT last_uid FROM sync_state WHERE account_id=?", (account_id,))
-    last_uid = int(state["last_uid"]) if state else 0
 
-    client = imaplib.IMAP4_SSL(account["imap_host"], account["imap_port"]) if account["use_ssl"] else imaplib.IMAP4(account["imap_host"], account["imap_port"])
+def smtp_close(server: smtplib.SMTP):
     try:
-        client.login(account["email"], account["password"])
-        client.select("INBOX")
+        server.quit()
+    except Exception:
+        server.close()
 
-        uid_range = f"{last_uid + 1}:*" if last_uid > 0 else "1:*"
-        status, uid_data = client.uid("search", None, f"UID {uid_range}")
-        if status != "OK":
-            return 0
-        uids = [u for u in (uid_data[0] or b"").split() if u]
-        if not uids:
-            return 0
-
-        saved = 0
-        max_uid = last_uid
-        for uid in uids[-200:]:
-            uid_int = int(uid)
-            if uid_int > max_uid:
-                max_uid = uid_int
-            status, payload = client.uid("fetch", uid, "(RFC822)")
-            if status != "OK" or not payload or payload[0] is None:
-                continue
-            raw = payload[0][1] if isinstance(payload[0], tuple) else None
-            if not raw:
-                continue
-
-            msg = message_from_bytes(raw)
-            sender, sender_name = parse_from_header(msg.get("From", ""))
-            if not sender or sender == account["email"].lower():
-                continue
-
-            subject = msg.get("Subject", "")
-            if should_skip_message(sender, subject, msg, settings):
-                continue
-
-            body, body_html = extract_bodies(msg, strip_replies=setting_bool(settings, "strip_replies"))
-            if not body and not body_html:
-                continue
 
-            try:
-                sent_at = parsedate_to_datetime(msg.get("Date")).astimezone(timezone.utc).isoformat()
-            except Exception:
-                sent_at = utc_now_iso()
+def smtp_send_with_security(account, msg: EmailMessage):
+    account_id = account["id"]
+    with smtp_lock(account_id):
+        server, sends = None, 0
+        pooled = SMTP_POOL.pop(account_id, None)
+        if pooled is not None:
+            server, last_used, sends = pooled
+            if time.monotonic() - last_used > SMTP_IDLE_SECONDS or sends >= SMTP_MAX_SENDS:
+                smtp_close(server)
+                server = None
+            else:
+                try:
+                    if server.noop()[0] != 250:
+                        raise smtplib.SMTPServerDisconnected("NOOP rejected")
+                except (smtplib.SMTPException, OSError):
+                    server.close()
+                    server = None
+        if server is None:
+            server, sends = smtp_connect(account), 0
+        try:
+            server.send_message(msg)
+        except BaseException:
+            smtp_close(server)
+            raise
+        SMTP_POOL[account_id] = (server, time.monotonic(), sends + 1)
+
+
+def fetch_messages(client, uids: list[bytes], items: str):
+    # The next batch is fetched on a helper thread while the caller parses the current one.
+    batches = [b",".join(uids[i:i + IMAP_FETCH_BATCH]) for i in range(0, len(uids), IMAP_FETCH_BATCH)]
+    if not batches:
+        return
+    if len(batches) == 1:
+        yield from parse_fetch_response(*client.uid("fetch", batches[0], items))
+        return
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="imap-fetch") as pool:
+        pending = pool.submit(client.uid, "fetch", batches[0], items)
+        for batch in batches[1:]:
+            response = pending.result()
+            pending = pool.submit(client.uid, "fetch", batch, items)
+            yield from parse_fetch_response(*response)
+        yield from parse_fetch_response(*pending.result())
+
+
+def parse_fetch_response(status: str, payload: list):
+    if status != "OK" or not payload:
+        return
+    for n, item in enumerate(payload):
+        if not isinstance(item, tuple) or not item[1]:
+            continue
+        match = FETCH_UID_RE.search(item[0])
+        # Some servers send the UID after the literal, in the trailing ")" element.
+        if match is None and n + 1 < len(payload) and isinstance(payload[n + 1], bytes):
+            match = FETCH_UID_RE.search(payload[n + 1])
+        if match:
+            yield int(match.group(1)), item[1]
+
+
+def imap_search_criteria(uid_range: str, filter_promo: bool) -> str:
+    # Sender filters use boundary rules SEARCH FROM cannot express and stay client-side.
+    criteria = [f"UID {uid_range}"]
+    if filter_promo:
+        criteria.append('NOT HEADER List-ID ""')
+        criteria.extend(f'NOT HEADER Precedence "{p}"' for p in BULK_PRECEDENCE)
+        criteria.extend(f'NOT SUBJECT "{kw}"' for kw in PROMO_SUBJECT_KEYWORDS)
+    return " ".join(criteria)
+
+
+def imap_lock(account_id: int) -> threading.Lock:
+    with IMAP_POOL_LOCK:
+        return IMAP_LOCKS.setdefault(account_id, threading.Lock())
+
+
+def imap_discard(account_id: int):
+    client = IMAP_POOL.pop(account_id, None)
+    if client is not None:
+        try:
+            client.logout()
+        except Exception:
+            pass
 
-            upsert_contact(account_id, sender, sender_name)
-            try:
-                db_execute(
-                    """
-                    INSERT INTO messages(account_id, contact_email, direction, subject, body, body_html, sent_at, external_message_id, created_at)
-                    VALUES (?, ?, 'inbound', ?, ?, ?, ?, ?, ?)
-                    """,
-                    (account_id, sender, subject, body or "", body_html, sent_at, msg.get("Message-ID"), utc_now_iso()),
-                )
-                saved += 1
-            except sqlite3.IntegrityError:
-                continue
 
-        db_execute(
-            "INSERT INTO sync_state(account_id,last_uid,updated_at) VALUES(?,?,?) ON CONFLICT(account_id) DO UPDATE SET last_uid=excluded.last_uid, updated_at=excluded.updated_at",
-            (account_id, max_uid, utc_now_iso()),
-        )
-        return saved
-    finally:
+def imap_client(account):
+    # Callers hold imap_lock().
+    client = IMAP_POOL.get(account["id"])
+    if client is not None:
+        try:
+            if client.noop()[0] == "OK":
+                return client
+        except (imaplib.IMAP4.error, OSError):
+            pass
+        imap_discard(account["id"])
+
+    client = imaplib.IMAP4_SSL(account["imap_host"], account["imap_port"], timeout=30) if account["use_ssl"] else imaplib.IMAP4(account["imap_host"], account["imap_port"], timeout=30)
+    try:
+        client.login(account["email"], account["password"])
+        client.select("INBOX")
+    except Exception:
         try:
             client.logout()
         except Exception:
             pass
+        raise
+    IMAP_POOL[account["id"]] = client
+    return client
 
 
-def send_message(account_id: int, to_email: str, body: str, is_html: bool = False):
-    account = db_fetch_one("SELECT * FROM accounts WHERE id=?", (account_id,))
+def sync_account(account_id: int):
+    account = get_account(account_id)
+    if not account:
+        raise ValueError("Konto wurde nicht gefunden.")
+    settings = get_settings()
+    strip_replies = setting_bool(settings, "strip_replies")
+    filter_noreply = setting_bool(settings, "filter_noreply")
+    filter_info = setting_bool(settings, "filter_info_addresses")
+    filter_promo = setting_bool(settings, "filter_promotions")
+    self_email = account["email"].lower()
+
+    lock = imap_lock(account_id)
+    if not lock.acquire(blocking=False):
+        return 0
+    try:
+        state = db_fetch_one("SELECT last_uid FROM sync_state WHERE account_id=?", (account_id,))
+        last_uid = int(state["last_uid"]) if state else 0
+
+        client = imap_client(account)
+        try:
+            uid_range = f"{last_uid + 1}:*" if last_uid > 0 else "1:*"
+            status, uid_data = client.uid("search", None, imap_search_criteria(uid_range, filter_promo))
+            if status != "OK":
+                return 0
+            # "N:*" always includes the newest message, even when its UID is below N.
+            uids = [u for u in (uid_data[0] or b"").split() if u and int(u) > last_uid]
+            if not uids:
+                return 0
+
+            uids = uids[-SYNC_MAX_MESSAGES:]
+            max_uid = max(last_uid, max(int(uid) for uid in uids))
+            candidates = {}
+            for uid, raw_headers in fetch_messages(client, uids, IMAP_HEADER_ITEMS):
+                try:
+                    headers = HEADER_PARSER.parsebytes(raw_headers, headersonly=True)
+                    sender, sender_name = parse_from_header(headers.get("From", ""))
+                    if not sender or sender == self_email:
+                        continue
+
+                    subject = headers.get("Subject", "")
+                    if should_skip_message(sender, subject, headers, filter_noreply, filter_info, filter_promo):
+                        continue
+                    date, message_id = headers.get("Date"), headers.get("Message-ID")
+                except Exception:
+                    # policy.default raises on some malformed headers.
+                    continue
+                candidates[uid] = (sender, sender_name, subject, date, message_id)
+
+            contacts = []
+            rows = []
+            wanted = [uid for uid in uids if int(uid) in candidates]
+            for uid, raw in fetch_messages(client, wanted, IMAP_MESSAGE_ITEMS):
+                if uid not in candidates:
+                    continue
+                sender, sender_name, subject, date, message_id = candidates[uid]
+                try:
+                    body, body_html = extract_bodies(message_from_bytes(raw, policy=policy.default), strip_replies=strip_replies)
+                except Exception:
+                    continue
+                if not body and not body_html:
+                    continue
+
+                try:
+                    sent_at = parsedate_to_datetime(date).astimezone(timezone.utc).isoformat()
+                except Exception:
+                    sent_at = utc_now_iso()
+
+                contacts.append((account_id, sender, sender_name))
+                rows.append((account_id, sender, subject, body or "", body_html, sent_at, message_id, utc_now_iso()))
+
+            with db_transaction() as conn:
+                conn.executemany(UPSERT_CONTACT_SQL, contacts)
+                saved = conn.executemany(INSERT_INBOUND_SQL, rows).rowcount
+                conn.execute(
+                    "INSERT INTO sync_state(account_id,last_uid,updated_at) VALUES(?,?,?) ON CONFLICT(account_id) DO UPDATE SET last_uid=excluded.last_uid, updated_at=excluded.updated_at",
+                    (account_id, max_uid, utc_now_iso()),
+                )
+            return saved
+        except (imaplib.IMAP4.error, OSError):
+            imap_discard(account_id)
+            raise
+    finally:
+        lock.release()
+
+
+def send_message(account_id: int, to_email: str, body: str, is_html: bool = False, text_body: str | None = None):
+    account = get_account(account_id)
     if not account:
         raise ValueError("Konto wurde nicht gefunden.")
 
     to_email = to_email.lower().strip()
     now = utc_now_iso()
+    if text_body is None:
+        text_body = html_to_text(body) if is_html else body
 
     msg = EmailMessage()
     msg["From"] = account["email"]
     msg["To"] = to_email
     msg["Subject"] = "Chat-Nachricht"
     if is_html:
-        text_fallback = re.sub(r"<[^>]+>", " ", body)
-        text_fallback = re.sub(r"\s+", " ", text_fallback).strip()
-        msg.set_content(text_fallback or "HTML Nachricht")
+        msg.set_content(text_body or "HTML Nachricht")
         msg.add_alternative(body, subtype="html")
     else:
         msg.set_content(body)
@@ -411,178 +726,321 @@ def send_message(account_id: int, to_email: str, body: str, is_html: bool = Fals
         INSERT INTO messages(account_id, contact_email, direction, subject, body, body_html, sent_at, external_message_id, created_at)
         VALUES (?, ?, 'outbound', 'Chat-Nachricht', ?, ?, ?, ?, ?)
         """,
-        (account_id, to_email, re.sub(r"<[^>]+>", " ", body).strip() if is_html else body, body if is_html else None, now, msg["Message-ID"], now),
+        (account_id, to_email, text_body, body if is_html else None, now, msg["Message-ID"], now),
     )
     return {
         "id": msg_id,
         "direction": "outbound",
-        "body": re.sub(r"<[^>]+>", " ", body).strip() if is_html else body,
+        "body": text_body,
         "body_html": body if is_html else None,
         "sent_at": now,
     }
 
 
 def send_group_message(account_id: int, group_id: int, body: str, is_html=False):
-    account = db_fetch_one("SELECT * FROM accounts WHERE id=?", (account_id,))
-    group = db_fetch_one("SELECT * FROM chat_groups WHERE id=? AND account_id=?", (group_id, account_id))
+    account = get_account(account_id)
+    group = db_fetch_one("SELECT id FROM chat_groups WHERE id=? AND account_id=?", (group_id, account_id))
     if not account or not group:
         raise ValueError("Gruppe oder Konto nicht gefunden.")
     members = db_fetch_all("SELECT email FROM group_members WHERE group_id=?", (group_id,))
     if not members:
         raise ValueError("Gruppe hat keine Mitglieder.")
 
+    text_body = html_to_text(body) if is_html else body
     for m in members:
-        send_message(account_id, m["email"], body, is_html)
+        send_message(account_id, m["email"], body, is_html, text_body)
 
     now = utc_now_iso()
     msg_id = db_execute(
         "INSERT INTO group_messages(account_id, group_id, direction, sender_email, body, body_html, sent_at) VALUES(?,?,'outbound',?,?,?,?)",
-        (account_id, group_id, account["email"], re.sub(r"<[^>]+>", " ", body).strip() if is_html else body, body if is_html else None, now),
+        (account_id, group_id, account["email"], text_body, body if is_html else None, now),
     )
     return {
         "id": msg_id,
         "direction": "outbound",
-        "body": re.sub(r"<[^>]+>", " ", body).strip() if is_html else body,
+        "body": text_body,
         "body_html": body if is_html else None,
         "sent_at": now,
     }
 
 
 class AppHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = 15
+    disable_nagle_algorithm = True
+    keepalive_max_requests = 100
+    keepalive_max_seconds = 10
+
+    def setup(self):
+        super().setup()
+        self.connection_started = time.monotonic()
+        self.requests_served = 0
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        # Rotate busy keep-alive connections so queued ones get a pool worker.
+        self.requests_served += 1
+        if self.requests_served >= self.keepalive_max_requests or time.monotonic() - self.connection_started >= self.keepalive_max_seconds:
+            self.send_header("Connection", "close")
+
+    def api_accounts(self, query: str):
+        return json_response(self, db_fetch_all("SELECT id, name, email, imap_host, imap_port, smtp_host, smtp_port, use_ssl, smtp_security, created_at FROM accounts ORDER BY id DESC"))
+
+    def api_settings(self, query: str):
+        return json_response(self, get_settings())
+
+    def api_contacts(self, query: str):
+        account_id = int(query_param(query, "account_id", "0"))
+        return json_response(self, db_fetch_all("SELECT email, COALESCE(display_name,'') AS display_name FROM contacts WHERE account_id=? ORDER BY COALESCE(display_name,email)", (account_id,)))
+
+    def api_groups(self, query: str):
+        account_id = int(query_param(query, "account_id", "0"))
+        groups = db_fetch_all("""
+            SELECT g.id, g.name, COUNT(m.id) AS members
+            FROM chat_groups g LEFT JOIN group_members m ON m.group_id=g.id
+            WHERE g.account_id=?
+            GROUP BY g.id
+            ORDER BY g.name
+        """, (account_id,))
+        return json_response(self, groups)
+
+    def api_group_messages(self, query: str):
+        account_id = int(query_param(query, "account_id", "0"))
+        group_id = int(query_param(query, "group_id", "0"))
+        since_id = int(query_param(query, "since_id", "0"))
+        rows = db_fetch_all("SELECT id, direction, body, body_html, sent_at, sender_email FROM group_messages WHERE account_id=? AND group_id=? AND id>? ORDER BY sent_at ASC,id ASC", (account_id, group_id, since_id))
+        return json_response(self, rows)
+
+    def api_chats(self, query: str):
+        account_id = int(query_param(query, "account_id", "0"))
+        chats = db_fetch_all(
+            """
+            SELECT m.contact_email,
+                   COALESCE(c.display_name, m.contact_email) AS display_name,
+                   m.sent_at AS last_at,
+                   m.body AS last_body
+            FROM (
+                SELECT account_id, contact_email, body, sent_at,
+                       ROW_NUMBER() OVER (PARTITION BY contact_email ORDER BY sent_at DESC, id DESC) AS rn
+                FROM messages
+                WHERE account_id=?
+            ) m
+            LEFT JOIN contacts c ON c.account_id=m.account_id AND c.email=m.contact_email
+            WHERE m.rn=1
+            ORDER BY last_at DESC
+            """,
+            (account_id,),
+        )
+        return json_response(self, chats)
+
+    def api_messages(self, query: str):
+        account_id = int(query_param(query, "account_id", "0"))
+        contact = query_param(query, "contact").lower().strip()
+        since_id = int(query_param(query, "since_id", "0"))
+        rows = db_fetch_all(
+            """
+            SELECT m.id, m.direction, m.body, m.body_html, m.sent_at, COALESCE(c.display_name, m.contact_email) AS display_name
+            FROM messages m
+            LEFT JOIN contacts c ON c.account_id=m.account_id AND c.email=m.contact_email
+            WHERE m.account_id=? AND m.contact_email=? AND m.id>?
+            ORDER BY m.sent_at ASC, m.id ASC
+            """,
+            (account_id, contact, since_id),
+        )
+        return json_response(self, rows)
+
+    def api_create_account(self):
+        data = parse_json_body(self)
+        required = ["name", "email", "imap_host", "imap_port", "smtp_host", "smtp_port", "password"]
+        missing = [k for k in required if not data.get(k)]
+        if missing:
+            return json_response(self, {"error": f"Fehlende Felder: {', '.join(missing)}"}, 400)
+        account_id = db_execute(
+            "INSERT INTO accounts(name,email,imap_host,imap_port,smtp_host,smtp_port,password,use_ssl,smtp_security,created_at) VALUES(?,?,?,?,?,?,?,?,?,?)",
+            (data["name"], data["email"], data["imap_host"], int(data["imap_port"]), data["smtp_host"], int(data["smtp_port"]), data["password"], 1 if data.get("use_ssl", True) else 0, data.get("smtp_security", "auto"), utc_now_iso()),
+        )
+        return json_response(self, {"id": account_id}, 201)
+
+    def api_sync(self):
+        return json_response(self, {"saved": sync_account(int(parse_json_body(self)["account_id"]))})
+
+    def api_send(self):
+        data = parse_json_body(self)
+        message = send_message(int(data["account_id"]), data["to_email"], data["body"], bool(data.get("is_html")))
+        return json_response(self, {"ok": True, "message": message}, 201)
+
+    def api_send_group(self):
+        data = parse_json_body(self)
+        message = send_group_message(int(data["account_id"]), int(data["group_id"]), data["body"], bool(data.get("is_html")))
+        return json_response(self, {"ok": True, "message": message}, 201)
+
+    def api_save_contact(self):
+        data = parse_json_body(self)
+        upsert_contact(int(data["account_id"]), data["email"].lower().strip(), data.get("display_name") or None)
+        return json_response(self, {"ok": True}, 201)
+
+    def api_create_group(self):
+        data = parse_json_body(self)
+        with db_transaction() as conn:
+            group_id = conn.execute("INSERT INTO chat_groups(account_id,name,created_at) VALUES(?,?,?)", (int(data["account_id"]), data["name"], utc_now_iso())).lastrowid
+            conn.executemany("INSERT OR IGNORE INTO group_members(group_id,email) VALUES(?,?)", [(group_id, email.lower().strip()) for email in data.get("members", [])])
+        return json_response(self, {"id": group_id}, 201)
+
+    def api_save_settings(self):
+        data = parse_json_body(self)
+        with db_transaction() as conn:
+            conn.executemany(
+                "INSERT INTO settings(key,value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                [(k, str(v)) for k, v in data.items() if k in DEFAULT_SETTINGS],
+            )
+        invalidate_settings()
+        return json_response(self, {"ok": True}, 200)
+
+    GET_ROUTES = {
+        "/api/accounts": api_accounts,
+        "/api/settings": api_settings,
+        "/api/contacts": api_contacts,
+        "/api/groups": api_groups,
+        "/api/group_messages": api_group_messages,
+        "/api/chats": api_chats,
+        "/api/messages": api_messages,
+    }
+    POST_ROUTES = {
+        "/api/accounts": api_create_account,
+        "/api/sync": api_sync,
+        "/api/send": api_send,
+        "/api/send_group": api_send_group,
+        "/api/contacts": api_save_contact,
+        "/api/groups": api_create_group,
+        "/api/settings": api_save_settings,
+    }
+
     def do_GET(self):
-        parsed = urlparse(self.path)
-        if parsed.path in ("/", "/index.html"):
+        path, _, query = self.path.partition("?")
+        route = self.GET_ROUTES.get(path)
+        if route is not None:
+            return route(self, query)
+        if path in ("/", "/index.html"):
             return self.serve_file(STATIC_DIR / "index.html", "text/html; charset=utf-8")
-        if parsed.path.startswith("/static/"):
-            return self.serve_file(STATIC_DIR / parsed.path.replace("/static/", "", 1))
-
-        if parsed.path == "/api/accounts":
-            return json_response(self, db_fetch_all("SELECT id, name, email, imap_host, imap_port, smtp_host, smtp_port, use_ssl, smtp_security, created_at FROM accounts ORDER BY id DESC"))
-        if parsed.path == "/api/settings":
-            return json_response(self, get_settings())
-        if parsed.path == "/api/contacts":
-            account_id = int((parse_qs(parsed.query).get("account_id") or ["0"])[0])
-            return json_response(self, db_fetch_all("SELECT email, COALESCE(display_name,'') AS display_name FROM contacts WHERE account_id=? ORDER BY COALESCE(display_name,email)", (account_id,)))
-        if parsed.path == "/api/groups":
-            account_id = int((parse_qs(parsed.query).get("account_id") or ["0"])[0])
-            groups = db_fetch_all("""
-                SELECT g.id, g.name, COUNT(m.id) AS members
-                FROM chat_groups g LEFT JOIN group_members m ON m.group_id=g.id
-                WHERE g.account_id=?
-                GROUP BY g.id
-                ORDER BY g.name
-            """, (account_id,))
-            return json_response(self, groups)
-        if parsed.path == "/api/group_messages":
-            params = parse_qs(parsed.query)
-            account_id = int((params.get("account_id") or ["0"])[0])
-            group_id = int((params.get("group_id") or ["0"])[0])
-            since_id = int((params.get("since_id") or ["0"])[0])
-            rows = db_fetch_all("SELECT id, direction, body, body_html, sent_at, sender_email FROM group_messages WHERE account_id=? AND group_id=? AND id>? ORDER BY sent_at ASC,id ASC", (account_id, group_id, since_id))
-            return json_response(self, rows)
-        if parsed.path == "/api/chats":
-            account_id = int((parse_qs(parsed.query).get("account_id") or ["0"])[0])
-            chats = db_fetch_all(
-                """
-                SELECT m.contact_email,
-                       COALESCE(c.display_name, m.contact_email) AS display_name,
-                       MAX(m.sent_at) AS last_at,
-                       (SELECT body FROM messages m2 WHERE m2.account_id = m.account_id AND m2.contact_email = m.contact_email ORDER BY sent_at DESC, id DESC LIMIT 1) AS last_body
-                FROM messages m
-                LEFT JOIN contacts c ON c.account_id=m.account_id AND c.email=m.contact_email
-                WHERE m.account_id=?
-                GROUP BY m.contact_email
-                ORDER BY last_at DESC
-                """,
-                (account_id,),
-            )
-            return json_response(self, chats)
-        if parsed.path == "/api/messages":
-            params = parse_qs(parsed.query)
-            account_id = int((params.get("account_id") or ["0"])[0])
-            contact = (params.get("contact") or [""])[0].lower().strip()
-            since_id = int((params.get("since_id") or ["0"])[0])
-            rows = db_fetch_all(
-                """
-                SELECT m.id, m.direction, m.body, m.body_html, m.sent_at, COALESCE(c.display_name, m.contact_email) AS display_name
-                FROM messages m
-                LEFT JOIN contacts c ON c.account_id=m.account_id AND c.email=m.contact_email
-                WHERE m.account_id=? AND m.contact_email=? AND m.id>?
-                ORDER BY m.sent_at ASC, m.id ASC
-                """,
-                (account_id, contact, since_id),
-            )
-            return json_response(self, rows)
+        if path.startswith("/static/"):
+            return self.serve_file(STATIC_DIR / path[len("/static/"):])
 
-        if not parsed.path.startswith("/api/"):
+        if not path.startswith("/api/"):
             return self.serve_file(STATIC_DIR / "index.html", "text/html; charset=utf-8")
         self.send_error(404, "Not Found")
 
     def do_POST(self):
-        parsed = urlparse(self.path)
+        route = self.POST_ROUTES.get(self.path.partition("?")[0])
+        if route is None:
+            return self.send_error(404, "Not Found")
         try:
-            if parsed.path == "/api/accounts":
-                data = parse_json_body(self)
-                required = ["name", "email", "imap_host", "imap_port", "smtp_host", "smtp_port", "password"]
-                missing = [k for k in required if not data.get(k)]
-                if missing:
-                    return json_response(self, {"error": f"Fehlende Felder: {', '.join(missing)}"}, 400)
-                account_id = db_execute(
-                    "INSERT INTO accounts(name,email,imap_host,imap_port,smtp_host,smtp_port,password,use_ssl,smtp_security,created_at) VALUES(?,?,?,?,?,?,?,?,?,?)",
-                    (data["name"], data["email"], data["imap_host"], int(data["imap_port"]), data["smtp_host"], int(data["smtp_port"]), data["password"], 1 if data.get("use_ssl", True) else 0, data.get("smtp_security", "auto"), utc_now_iso()),
-                )
-                return json_response(self, {"id": account_id}, 201)
-            if parsed.path == "/api/sync":
-                return json_response(self, {"saved": sync_account(int(parse_json_body(self)["account_id"]))})
-            if parsed.path == "/api/send":
-                data = parse_json_body(self)
-                message = send_message(int(data["account_id"]), data["to_email"], data["body"], bool(data.get("is_html")))
-                return json_response(self, {"ok": True, "message": message}, 201)
-            if parsed.path == "/api/send_group":
-                data = parse_json_body(self)
-                message = send_group_message(int(data["account_id"]), int(data["group_id"]), data["body"], bool(data.get("is_html")))
-                return json_response(self, {"ok": True, "message": message}, 201)
-            if parsed.path == "/api/contacts":
-                data = parse_json_body(self)
-                upsert_contact(int(data["account_id"]), data["email"].lower().strip(), data.get("display_name") or None)
-                return json_response(self, {"ok": True}, 201)
-            if parsed.path == "/api/groups":
-                data = parse_json_body(self)
-                group_id = db_execute("INSERT INTO chat_groups(account_id,name,created_at) VALUES(?,?,?)", (int(data["account_id"]), data["name"], utc_now_iso()))
-                for email in data.get("members", []):
-                    db_execute("INSERT OR IGNORE INTO group_members(group_id,email) VALUES(?,?)", (group_id, email.lower().strip()))
-                return json_response(self, {"id": group_id}, 201)
-            if parsed.path == "/api/settings":
-                data = parse_json_body(self)
-                for k, v in data.items():
-                    if k in DEFAULT_SETTINGS:
-                        db_execute("INSERT INTO settings(key,value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value", (k, str(v)))
-                return json_response(self, {"ok": True}, 200)
+            return route(self)
         except Exception as e:
             try:
                 return json_response(self, {"error": str(e)}, 500)
             except Exception:
                 return
-        self.send_error(404, "Not Found")
 
     def serve_file(self, file_path: Path, content_type: str | None = None):
-        if not file_path.exists() or not file_path.is_file():
+        try:
+            st = os.stat(file_path)
+        except (OSError, ValueError):
             return self.send_error(404, "Not Found")
-        raw = file_path.read_bytes()
-        if content_type is None:
-            content_type = mimetypes.guess_type(str(file_path))[0] or "application/octet-stream"
-        self.send_response(200)
-        self.send_header("Content-Type", content_type)
-        self.send_header("Content-Length", str(len(raw)))
+        asset = STATIC_ASSETS.get(file_path)
+        if asset is None or asset[0] != st.st_mtime_ns:
+            if st.st_size > STATIC_CACHE_MAX_BYTES or not file_path.is_file() or not file_path.resolve().is_relative_to(STATIC_DIR.resolve()):
+                return self.send_disk_file(file_path, content_type)
+            with STATIC_LOCK:
+                asset = STATIC_ASSETS.get(file_path)
+                if asset is None or asset[0] != st.st_mtime_ns:
+                    asset = load_static_asset(file_path)
+                    STATIC_ASSETS[file_path] = asset
+        mtime_ns, raw, guessed_type, etag = asset
         try:
-            self.end_headers()
-            self.wfile.write(raw)
+            body_range = self.send_file_headers(content_type or guessed_type, len(raw), etag, mtime_ns // 1_000_000_000)
+            if body_range is not None:
+                self.wfile.write(memoryview(raw)[body_range[0]:body_range[1]])
         except (BrokenPipeError, ConnectionAbortedError, ConnectionResetError, OSError):
             return
 
+    def send_disk_file(self, file_path: Path, content_type: str | None = None):
+        if not file_path.is_file() or not file_path.resolve().is_relative_to(STATIC_DIR.resolve()):
+            return self.send_error(404, "Not Found")
+        with open(file_path, "rb") as f:
+            st = os.fstat(f.fileno())
+            etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+            content_type = content_type or mimetypes.guess_type(str(file_path))[0] or "application/octet-stream"
+            try:
+                body_range = self.send_file_headers(content_type, st.st_size, etag, st.st_mtime_ns // 1_000_000_000)
+                if body_range is not None and body_range[1] > body_range[0]:
+                    self.connection.sendfile(f, body_range[0], body_range[1] - body_range[0])
+            except (BrokenPipeError, ConnectionAbortedError, ConnectionResetError, OSError):
+                return
+
+    def send_file_headers(self, content_type: str, size: int, etag: str, mtime: int) -> tuple[int, int] | None:
+        # Returns the half-open byte range to write, or None when no body follows.
+        last_modified = formatdate(mtime, usegmt=True)
+        if_none_match = self.headers.get("If-None-Match")
+        if etag_matches(if_none_match, etag) or (if_none_match is None and not modified_since(self.headers.get("If-Modified-Since"), mtime)):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            return None
+
+        if_range = self.headers.get("If-Range")
+        try:
+            body_range = parse_byte_range(self.headers.get("Range"), size) if if_range in (None, etag, last_modified) else None
+        except ValueError:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+
+        if body_range is None:
+            body_range = (0, size)
+            self.send_response(200)
+        else:
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {body_range[0]}-{body_range[1] - 1}/{size}")
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(body_range[1] - body_range[0]))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        return body_range
+
+
+class AppServer(ThreadingHTTPServer):
+    max_workers = 32
+    max_queued = 64
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending = queue.Queue(maxsize=self.max_queued)
+        for n in range(self.max_workers):
+            threading.Thread(target=self.serve_pending, name=f"http-{n}", daemon=True).start()
+
+    def serve_pending(self):
+        while True:
+            self.process_request_thread(*self.pending.get())
+
+    def process_request(self, request, client_address):
+        try:
+            self.pending.put_nowait((request, client_address))
+        except queue.Full:
+            try:
+                request.sendall(SERVICE_UNAVAILABLE_RESPONSE)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+
 
 if __name__ == "__main__":
     init_db()
-    server = ThreadingHTTPServer(("0.0.0.0", int(os.getenv("PORT", "8000"))), AppHandler)
+    preload_static_assets()
+    server = AppServer(("0.0.0.0", int(os.getenv("PORT", "8000"))), AppHandler)
     print("MailChat läuft auf http://localhost:8000")
     server.serve_forever()